@@ -5,6 +5,9 @@ Run this on Home Assistant to see what uplink/downlink data is available.
 
 Usage:
   UNIFI_HOST=192.168.1.1 UNIFI_USERNAME=xxx UNIFI_PASSWORD=xxx python3 debug_topology.py
+
+  Add --verbose (or UNIFI_DEBUG_VERBOSE=1) to also dump full uplink objects
+  and per-port details.
 """
 
 import json
@@ -12,9 +15,27 @@ import sys
 import os
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Shared session - login and device fetch reuse the same keep-alive connection
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=4,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+))
+_SESSION.headers.update({
+    "Accept-Encoding": "gzip, deflate",
+    "Accept": "application/json",
+    "Connection": "keep-alive",
+})
+
+# Full uplink dumps and port tables are only printed when asked for
+VERBOSE = "--verbose" in sys.argv or os.environ.get("UNIFI_DEBUG_VERBOSE") == "1"
+
 def main():
     config = {
         "host": os.environ.get("UNIFI_HOST", "192.168.1.1"),
@@ -27,7 +48,7 @@ def main():
         print("ERROR: Set UNIFI_USERNAME and UNIFI_PASSWORD environment variables")
         sys.exit(1)
 
-    session = requests.Session()
+    session = _SESSION
 
     # Login
     auth_url = f"https://{config['host']}/api/auth/login"
@@ -47,7 +68,7 @@ def main():
     resp = session.get(devices_url, verify=False, timeout=15)
     devices = resp.json().get("data", [])
 
-    print(f"Found {len(devices)} devices\n")
+    print(f"Found {len(devices)} devices (Content-Encoding: {resp.headers.get('Content-Encoding', 'none')})\n")
     print("=" * 80)
 
     for d in devices:
@@ -70,7 +91,8 @@ def main():
             print(f"    uplink_device_name: {uplink.get('uplink_device_name', 'EMPTY')}")
             print(f"    mac: {uplink.get('mac', 'EMPTY')}")
             print(f"    type: {uplink.get('type', 'EMPTY')}")
-            print(f"    Full uplink object: {json.dumps(uplink, indent=6)}")
+            if VERBOSE:
+                print(f"    Full uplink object: {json.dumps(uplink, indent=6)}")
         else:
             print("    (empty)")
 
@@ -94,7 +116,7 @@ def main():
 
         # PORT TABLE - check for mac_table entries
         port_table = d.get("port_table", [])
-        if port_table:
+        if VERBOSE and port_table:
             print(f"\n  PORT_TABLE ({len(port_table)} ports):")
             for p in port_table:
                 port_idx = p.get("port_idx")
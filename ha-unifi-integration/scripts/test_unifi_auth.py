@@ -13,6 +13,8 @@ Usage:
     # Or set vars in the script below for testing
 """
 
+import asyncio
+import ipaddress
 import json
 import os
 import sys
@@ -45,8 +47,15 @@ def test_dns_resolution():
     """Test if the host can be resolved."""
     print_header("TEST 1: DNS Resolution / Host Reachability")
 
+    # An IP literal needs no lookup - skip the resolver round-trip
+    try:
+        ipaddress.ip_address(TEST_HOST)
+        print_result("DNS/IP resolution", True, f"Host is an IP address: {TEST_HOST}")
+        return True
+    except ValueError:
+        pass
+
     try:
-        # If it's already an IP, this will just return it
         ip = socket.gethostbyname(TEST_HOST)
         print_result("DNS/IP resolution", True, f"Host resolves to: {ip}")
         return True
@@ -54,38 +63,49 @@ def test_dns_resolution():
         print_result("DNS/IP resolution", False, f"Cannot resolve host: {e}")
         return False
 
-def test_port_connectivity():
-    """Test if HTTPS port is open."""
-    print_header("TEST 2: Network Connectivity (Port 443)")
-
+def probe_port():
+    """Attempt a TCP connection to port 443 and return connect_ex's result code."""
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.settimeout(5)
 
     try:
-        result = sock.connect_ex((TEST_HOST, 443))
-        if result == 0:
-            print_result("Port 443 (HTTPS)", True, "Port is open and accepting connections")
-            return True
-        else:
-            print_result("Port 443 (HTTPS)", False, f"Connection refused (error code: {result})")
-            return False
-    except socket.error as e:
-        print_result("Port 443 (HTTPS)", False, f"Socket error: {e}")
-        return False
+        return sock.connect_ex((TEST_HOST, 443))
     finally:
         sock.close()
 
-def test_https_connection():
-    """Test HTTPS connection (with SSL verification disabled)."""
+def test_port_connectivity(outcome):
+    """Report whether the HTTPS port is open, given probe_port's result or error."""
+    print_header("TEST 2: Network Connectivity (Port 443)")
+
+    if isinstance(outcome, socket.error):
+        print_result("Port 443 (HTTPS)", False, f"Socket error: {outcome}")
+        return False
+    elif outcome == 0:
+        print_result("Port 443 (HTTPS)", True, "Port is open and accepting connections")
+        return True
+    else:
+        print_result("Port 443 (HTTPS)", False, f"Connection refused (error code: {outcome})")
+        return False
+
+def fetch_https():
+    """GET the controller's root page (with SSL verification disabled)."""
+    import requests
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    url = f"https://{TEST_HOST}/"
+    return requests.get(url, verify=False, timeout=10)
+
+def test_https_connection(outcome):
+    """Report on the HTTPS connection, given fetch_https's response or error."""
     print_header("TEST 3: HTTPS Connection")
 
     try:
         import requests
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-        url = f"https://{TEST_HOST}/"
-        response = requests.get(url, verify=False, timeout=10)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        response = outcome
         print_result("HTTPS connection", True, f"Status code: {response.status_code}")
 
         # Check if it's a UniFi device
@@ -110,6 +130,19 @@ def test_https_connection():
         print_result("HTTPS connection", False, f"Unexpected error: {e}")
         return False
 
+async def run_network_tests():
+    """
+    Run the port and HTTPS probes concurrently, then report them in order.
+    Both are independent blocking network calls, so the wait is the slower
+    of the two rather than their sum.
+    """
+    port_outcome, https_outcome = await asyncio.gather(
+        asyncio.to_thread(probe_port),
+        asyncio.to_thread(fetch_https),
+        return_exceptions=True
+    )
+    return test_port_connectivity(port_outcome), test_https_connection(https_outcome)
+
 def test_auth_endpoint():
     """Test the authentication endpoint specifically."""
     print_header("TEST 4: Authentication Endpoint")
@@ -243,8 +276,9 @@ def main():
 
     # Run tests in order
     results.append(("DNS/Network", test_dns_resolution()))
-    results.append(("Port Access", test_port_connectivity()))
-    results.append(("HTTPS", test_https_connection()))
+    port_ok, https_ok = asyncio.run(run_network_tests())
+    results.append(("Port Access", port_ok))
+    results.append(("HTTPS", https_ok))
     results.append(("Authentication", test_auth_endpoint()))
     test_2fa_check()
 
@@ -7,158 +7,573 @@ Place this file in: /config/scripts/unifi_clients.py
 Make executable: chmod +x /config/scripts/unifi_clients.py
 
 Required: pip install requests (usually pre-installed in HA)
+Optional: pip install ijson (stream-parses the client list instead of
+loading the whole response into memory first)
+Optional: pip install orjson (faster JSON parsing and output; falls back to
+the standard json module)
+
+Optional: UNIFI_DEVICE_CACHE_TTL (seconds, default 300, 0 disables) controls
+how long the device list is reused from UNIFI_DEVICE_CACHE between runs.
+Optional: UNIFI_COOKIE_FILE (default /tmp/unifi_cookies.txt) keeps the login
+cookie (and its CSRF token) between runs so most polls skip the login
+round-trip.
+Optional: UNIFI_KIND_FILE (default /tmp/unifi_kind.txt) remembers whether the
+controller answers on the UniFi OS or legacy (:8443) endpoints.
+Optional: UNIFI_MAX_AGE_SEC (seconds, default 0 = off) leaves out clients
+whose last_seen is older than this.
+Optional: UNIFI_DEBUG=true logs each API response's status and
+Content-Encoding to stderr (to confirm the controller is sending gzip).
 """
 
 import json
 import sys
 import os
+import time
+import functools
+import tempfile
+import queue
+import threading
+from collections import Counter
+import ipaddress
+from http.cookiejar import MozillaCookieJar, LoadError
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Disable SSL warnings for self-signed certs (UDM uses self-signed)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
+def build_session():
+    """
+    Create a requests session with a pooled HTTPS adapter that asks for
+    gzip-compressed responses. Calls to the same controller reuse keep-alive
+    sockets, so the TCP+TLS handshake is paid once per host instead of once
+    per request.
+    """
+    session = requests.Session()
+    # The script talks to at most two origins (:443 and legacy :8443) with at
+    # most two requests in flight, so a small pool keeps every socket warm
+    session.mount("https://", HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=4,
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+    ))
+    # Ask for compressed JSON explicitly - stat/sta and stat/device bodies
+    # shrink several-fold with gzip and requests decodes them transparently
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Accept": "application/json",
+        "Connection": "keep-alive",
+    })
+    return session
+
+
+# Shared session (cookie persistence + connection pool) for every API call
+_SESSION = build_session()
+
+# Bumped on every successful login so in-process device lookups are never
+# served from a previous session
+_login_generation = 0
+
+
 def get_config():
     """Load configuration from environment variables or defaults."""
-    return {
+    config = {
         "host": os.environ.get("UNIFI_HOST", "192.168.1.1"),
         "username": os.environ.get("UNIFI_USERNAME", ""),
         "password": os.environ.get("UNIFI_PASSWORD", ""),
         "site": os.environ.get("UNIFI_SITE", "default"),
-        "verify_ssl": os.environ.get("UNIFI_VERIFY_SSL", "false").lower() == "true"
+        "verify_ssl": os.environ.get("UNIFI_VERIFY_SSL", "false").lower() == "true",
+        "device_cache": os.environ.get("UNIFI_DEVICE_CACHE", "/tmp/unifi_devices.json"),
+        "device_cache_ttl": int(os.environ.get("UNIFI_DEVICE_CACHE_TTL", "300")),
+        "cookie_file": os.environ.get("UNIFI_COOKIE_FILE", "/tmp/unifi_cookies.txt"),
+        "kind_file": os.environ.get("UNIFI_KIND_FILE", "/tmp/unifi_kind.txt"),
+        "debug": os.environ.get("UNIFI_DEBUG", "false").lower() == "true",
+        "max_client_age": int(os.environ.get("UNIFI_MAX_AGE_SEC", "0")),
     }
+    # Controller kind ("udm" or "legacy") remembered from a previous run, if any
+    config["kind"] = read_controller_kind(config)
+    return config
+
+
+class SessionExpired(Exception):
+    """Raised when the controller rejects the session cookie (HTTP 401)."""
+
+
+def load_cookies(session, cookie_file):
+    """
+    Attach a file-backed cookie jar to the session, along with the CSRF token
+    UniFi OS issued with that cookie (kept next to it in <cookie_file>.csrf).
+    Returns True if a saved login cookie was loaded from a previous run.
+    """
+    jar = MozillaCookieJar(cookie_file)
+    try:
+        jar.load(ignore_discard=True)
+    except (OSError, LoadError):
+        pass  # No saved cookie yet (or unreadable) - start with an empty jar
+    session.cookies = jar
+
+    try:
+        with open(f"{cookie_file}.csrf") as f:
+            csrf_token = f.read().strip()
+        if csrf_token:
+            session.headers["X-CSRF-Token"] = csrf_token
+    except OSError:
+        pass
+
+    return len(jar) > 0
+
+
+def save_cookies(session):
+    """Persist the session's cookies and CSRF token for the next run (owner-readable only)."""
+    jar = session.cookies
+    csrf_path = f"{jar.filename}.csrf"
+    try:
+        os.close(os.open(jar.filename, os.O_WRONLY | os.O_CREAT, 0o600))
+        jar.save(ignore_discard=True)
+
+        csrf_token = session.headers.get("X-CSRF-Token")
+        if csrf_token:
+            with os.fdopen(os.open(csrf_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                f.write(csrf_token)
+    except OSError:
+        pass
+
+
+def discard_cookies(session):
+    """Forget a rejected login cookie and CSRF token, both in memory and on disk."""
+    session.cookies.clear()
+    session.headers.pop("X-CSRF-Token", None)
+    for path in (session.cookies.filename, f"{session.cookies.filename}.csrf"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def device_file_cache(fetch):
+    """
+    Cache the (name_map, devices_list) result of fetch on disk.
+    Device inventory changes rarely, so polls within device_cache_ttl seconds
+    of the last successful fetch skip the stat/device HTTPS call entirely.
+    After that the cached ETag is sent along, and a 304 from the controller
+    renews the cached copy instead of downloading it again.
+    """
+    @functools.wraps(fetch)
+    def wrapper(session, config):
+        cache_path = config["device_cache"]
+        ttl = config["device_cache_ttl"]
+        # UNIFI_HOST/UNIFI_SITE can change between runs (HA passes the host
+        # in from an input_text), so the cache is only valid for the same pair
+        controller = f"{config['host']}/{config['site']}"
+        cached = None
+
+        if ttl > 0:
+            try:
+                age = time.time() - os.path.getmtime(cache_path)
+                with open(cache_path, "rb") as f:
+                    cached = (orjson or json).loads(f.read())
+                if cached["controller"] != controller:
+                    cached = None  # Another controller's devices (and ETag)
+                elif age < ttl:
+                    return cached["name_map"], cached["devices"]
+            except (OSError, ValueError, KeyError, TypeError):
+                cached = None  # Missing or unreadable cache - do a full fetch
+
+        result = fetch(session, config, cached.get("etag") if cached else None)
+
+        if result is None:
+            # Not modified - restart the cached copy's TTL and reuse it
+            try:
+                os.utime(cache_path)
+            except OSError:
+                pass
+            return cached["name_map"], cached["devices"]
+
+        name_map, devices_list, etag = result
+
+        # Only cache successful fetches; write atomically so a concurrent run
+        # never reads a half-written file
+        if ttl > 0 and devices_list:
+            try:
+                cached = {
+                    "controller": controller,
+                    "etag": etag,
+                    "name_map": name_map,
+                    "devices": devices_list,
+                }
+                if orjson is not None:
+                    # name_map may hold a None key for devices without a MAC
+                    data = orjson.dumps(cached, option=orjson.OPT_NON_STR_KEYS)
+                else:
+                    data = json.dumps(cached).encode()
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path) or ".")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                pass
+
+        return name_map, devices_list
+
+    return wrapper
+
+
+def read_controller_kind(config):
+    """Return the controller kind ("udm" or "legacy") saved by a previous run, if any."""
+    try:
+        with open(config["kind_file"]) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def write_controller_kind(config, kind):
+    """Remember which kind of endpoints the controller answers on; kind=None forgets it."""
+    config["kind"] = kind
+    try:
+        if kind is None:
+            os.remove(config["kind_file"])
+        else:
+            with open(config["kind_file"], "w") as f:
+                f.write(kind)
+    except OSError:
+        pass
+
+
+def login(session, kind, url, payload, config):
+    """POST credentials to a single auth endpoint; raises on failure."""
+    # The auth cookie arrives in the headers, so the body is only read on
+    # success (it is tiny, and reading it returns the connection to the pool).
+    # Error pages - e.g. a large HTML 500 from a proxy - are never downloaded.
+    response = session.post(
+        url,
+        json=payload,
+        verify=config["verify_ssl"],
+        timeout=10,
+        stream=True
+    )
+    if response.ok:
+        response.content
+    response.close()
+    response.raise_for_status()
+
+    # UniFi OS returns a CSRF token with the login that must accompany later
+    # requests made with this cookie
+    csrf_token = response.headers.get("X-CSRF-Token")
+    if csrf_token:
+        session.headers["X-CSRF-Token"] = csrf_token
+    return kind
 
 
 def authenticate(session, config):
     """
     Authenticate to UniFi controller and return session with auth cookie.
     UDM Pro/SE uses a different auth endpoint than standalone controllers.
+    The endpoint that worked last time is tried on its own; otherwise both
+    are tried concurrently and the first successful login wins.
     """
-    # UDM Pro/SE authentication endpoint
-    auth_url = f"https://{config['host']}/api/auth/login"
+    auth_urls = {
+        # UDM Pro/SE authentication endpoint
+        "udm": f"https://{config['host']}/api/auth/login",
+        # Legacy endpoint (for older firmware or Cloud Key)
+        "legacy": f"https://{config['host']}:8443/api/login",
+    }
 
     payload = {
         "username": config["username"],
         "password": config["password"]
     }
 
-    try:
-        response = session.post(
-            auth_url,
-            json=payload,
-            verify=config["verify_ssl"],
-            timeout=10
-        )
-        response.raise_for_status()
-        return True
-    except requests.exceptions.RequestException as e:
-        # Try legacy endpoint (for older firmware or Cloud Key)
-        legacy_url = f"https://{config['host']}:8443/api/login"
+    global _login_generation
+
+    kind = config["kind"]
+    if kind in auth_urls:
         try:
-            response = session.post(
-                legacy_url,
-                json=payload,
-                verify=config["verify_ssl"],
-                timeout=10
-            )
-            response.raise_for_status()
+            login(session, kind, auth_urls[kind], payload, config)
+            _login_generation += 1
             return True
         except requests.exceptions.RequestException:
-            print(json.dumps({"error": f"Authentication failed: {str(e)}", "clients": []}))
-            return False
+            # Controller may have changed - forget it and probe both endpoints
+            write_controller_kind(config, None)
 
+    # Each login runs on a daemon thread: once one endpoint succeeds the other
+    # is abandoned, and a daemon thread can't hold the process open at exit
+    # while that request waits out its timeouts and retries
+    results = queue.Queue()
 
-def get_clients(session, config):
+    def attempt(endpoint, url):
+        try:
+            results.put((endpoint, login(session, endpoint, url, payload, config), None))
+        except Exception as e:
+            results.put((endpoint, None, e))
+
+    for endpoint, url in auth_urls.items():
+        threading.Thread(target=attempt, args=(endpoint, url), daemon=True).start()
+
+    errors = {}
+    for _ in auth_urls:
+        endpoint, kind, error = results.get()
+        if error is None:
+            write_controller_kind(config, kind)
+            _login_generation += 1
+            return True
+        errors[endpoint] = error
+
+    # Both failed - report the UDM endpoint's error as before
+    print(json.dumps({"error": f"Authentication failed: {str(errors['udm'])}", "clients": []}))
+    return False
+
+
+def load_json(response):
+    """Parse a JSON response body, using orjson when it is installed."""
+    if orjson is None:
+        return response.json()
+    try:
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError as e:
+        # Surface as a RequestException so callers' endpoint fallbacks still apply
+        raise requests.exceptions.InvalidJSONError(str(e), response=response)
+
+
+def write_json(output):
+    """Write output as a single line of JSON to stdout."""
+    if orjson is None:
+        json.dump(output, sys.stdout)
+        sys.stdout.write("\n")
+        return
+    # Hand the encoded bytes straight to the stdout file descriptor; flush
+    # first so nothing buffered in sys.stdout ends up after the JSON
+    sys.stdout.flush()
+    data = memoryview(orjson.dumps(output, option=orjson.OPT_APPEND_NEWLINE))
+    fd = sys.stdout.fileno()
+    while data:
+        # os.write may write less than asked when stdout is a pipe
+        data = data[os.write(fd, data):]
+
+
+def stream_records(response):
     """
-    Fetch all connected clients from UniFi controller.
-    Returns list of client dictionaries with switch port info.
+    Return the records of a UniFi {"data": [...]} response as a list.
+    With ijson installed the records are parsed incrementally as the body
+    streams in (response must be opened with stream=True), so the raw body is
+    never held in memory next to the parsed records; otherwise the whole body
+    is parsed up front. Either way a truncated or malformed body raises a
+    RequestException here, inside api_get, so its endpoint fallback applies.
     """
-    # UDM Pro/SE API endpoint for active clients
-    clients_url = f"https://{config['host']}/proxy/network/api/s/{config['site']}/stat/sta"
+    if ijson is None:
+        return load_json(response).get("data", [])
 
+    # Let urllib3 undo any gzip transfer encoding before ijson sees the bytes
+    response.raw.decode_content = True
     try:
-        response = session.get(
-            clients_url,
-            verify=config["verify_ssl"],
-            timeout=15
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data.get("data", [])
-    except requests.exceptions.RequestException:
-        # Try legacy endpoint
-        legacy_url = f"https://{config['host']}:8443/api/s/{config['site']}/stat/sta"
+        return list(ijson.items(response.raw, "data.item", use_float=True))
+    except ijson.JSONError as e:
+        # Surface as a RequestException, as load_json does, so a truncated
+        # body is never mistaken for a complete (shorter) record list
+        raise requests.exceptions.InvalidJSONError(str(e), response=response) from e
+    except urllib3.exceptions.HTTPError as e:
+        raise requests.exceptions.ConnectionError(e, response=response) from e
+    finally:
+        response.close()
+
+
+def api_get(session, config, path, parse, **kwargs):
+    """
+    GET an API path (e.g. "stat/sta") for the configured site and return
+    parse(response). The UniFi OS (/proxy/network) and legacy (:8443) bases
+    are tried in turn, starting with the kind remembered from an earlier run,
+    and whichever answers is remembered for the next one.
+    Raises SessionExpired on HTTP 401, or the last RequestException if
+    neither base works.
+    """
+    api_bases = {
+        "udm": f"https://{config['host']}/proxy/network/api/s/{config['site']}",
+        "legacy": f"https://{config['host']}:8443/api/s/{config['site']}",
+    }
+    kinds = ["legacy", "udm"] if config["kind"] == "legacy" else ["udm", "legacy"]
+
+    for kind in kinds:
         try:
             response = session.get(
-                legacy_url,
+                f"{api_bases[kind]}/{path}",
                 verify=config["verify_ssl"],
-                timeout=15
+                timeout=15,
+                **kwargs
             )
+            if config["debug"]:
+                # stdout carries the sensor JSON, so diagnostics go to stderr
+                # (one write per line - devices and clients are fetched in parallel)
+                sys.stderr.write(
+                    f"{kind} {path}: HTTP {response.status_code}, "
+                    f"Content-Encoding: {response.headers.get('Content-Encoding', 'identity')}\n"
+                )
+            if response.status_code == 401:
+                raise SessionExpired()
             response.raise_for_status()
-            data = response.json()
-            return data.get("data", [])
+            result = parse(response)
         except requests.exceptions.RequestException as e:
-            return []
+            error = e
+            continue
+
+        if kind != config["kind"]:
+            write_controller_kind(config, kind)
+        return result
+
+    raise error
+
+
+def get_clients(session, config):
+    """
+    Fetch all connected clients from UniFi controller.
+    Returns list of client dictionaries with switch port info.
+    """
+    try:
+        clients = api_get(session, config, "stat/sta", stream_records, stream=True)
+    except requests.exceptions.RequestException:
+        return []
+
+    # Drop clients not seen within max_client_age seconds before they are formatted
+    max_age = config["max_client_age"]
+    if max_age > 0:
+        cutoff = time.time() - max_age
+        clients = [c for c in clients if c.get("last_seen", 0) > cutoff]
+    return clients
 
 
 def get_devices(session, config):
     """
     Fetch all UniFi network devices (switches, APs, gateways) with full details.
-    Returns tuple of (name_map, devices_list).
+    Returns tuple of (name_map, devices_list), devices sorted by name.
+    When imported as a module, repeated calls for the same session, config
+    and login are served from memory.
     """
-    devices_url = f"https://{config['host']}/proxy/network/api/s/{config['site']}/stat/device"
+    result = _memo_devices(session, tuple(sorted(config.items())), _login_generation)
+    if not result[1]:
+        _memo_devices.cache_clear()  # Don't hold on to a failed fetch
+    return result
+
+
+@functools.lru_cache(maxsize=4)
+def _memo_devices(session, config_items, login_generation):
+    """In-process cache for get_devices (config is passed as hashable items)."""
+    return fetch_devices(session, dict(config_items))
+
+
+@device_file_cache
+def fetch_devices(session, config, etag=None):
+    """
+    Fetch all UniFi network devices (switches, APs, gateways) with full details.
+    Returns tuple of (name_map, devices_list, etag), with devices_list sorted
+    by name, or None if etag was given and the controller reports the device
+    list has not changed.
+    """
+    def parse(response):
+        return response, None if response.status_code == 304 else stream_records(response)
 
     try:
-        response = session.get(
-            devices_url,
-            verify=config["verify_ssl"],
-            timeout=15
+        response, raw_devices = api_get(
+            session, config, "stat/device", parse,
+            headers={"If-None-Match": etag} if etag else None,
+            stream=True
         )
-        response.raise_for_status()
-        data = response.json()
-        raw_devices = data.get("data", [])
+    except requests.exceptions.RequestException:
+        return {}, [], None
 
-        # Build name mapping for client lookups
-        name_map = {d.get("mac"): d.get("name", d.get("model", "Unknown"))
-                    for d in raw_devices}
+    if raw_devices is None:
+        response.close()
+        return None  # 304 Not Modified
 
-        # Format full device list
-        devices_list = [format_device(d) for d in raw_devices]
+    # Build the name mapping for client lookups and the device sort keys in
+    # one pass over the records
+    name_map = {}
+    keyed_devices = []
+    for i, d in enumerate(raw_devices):
+        device = format_device(d)
+        name_map[d.get("mac")] = device["name"]
+        keyed_devices.append((device["name"].lower(), i, device))
+
+    # Sort devices by name once here, so cached copies are already in order
+    keyed_devices.sort()
+    devices_list = [device for _, _, device in keyed_devices]
+
+    return name_map, devices_list, response.headers.get("ETag")
 
-        return name_map, devices_list
-    except requests.exceptions.RequestException:
-        return {}, []
+
+# RFC 1918 private ranges - where a gateway's LAN address lives
+_LAN_NETWORKS = (
+    ipaddress.ip_network("10.0.0.0/8"),
+    ipaddress.ip_network("172.16.0.0/12"),
+    ipaddress.ip_network("192.168.0.0/16"),
+)
+
+
+def is_lan_ip(address):
+    """Return True if address is an IPv4 address in a private (RFC 1918) range."""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return ip.version == 4 and any(ip in network for network in _LAN_NETWORKS)
+
+
+# UniFi device type -> category, resolved with a single dict lookup per device
+_DEVICE_CATEGORIES = {
+    **dict.fromkeys(("usw", "usw-pro", "usw-flex"), "switch"),
+    **dict.fromkeys(("uap", "uap-pro", "uap-ac", "u6"), "access_point"),
+    **dict.fromkeys(("ugw", "udm", "udr", "uxg"), "gateway"),
+}
+
+# Categories whose port_table is included in the output
+_PORTED_CATEGORIES = frozenset({"switch", "gateway"})
 
 
 def format_device(device):
     """
     Format a UniFi device (switch, AP, gateway) with relevant fields.
     """
-    device_type = device.get("type", "unknown")
-
-    # Determine device category
-    if device_type in ["usw", "usw-pro", "usw-flex"]:
-        category = "switch"
-    elif device_type in ["uap", "uap-pro", "uap-ac", "u6"]:
-        category = "access_point"
-    elif device_type in ["ugw", "udm", "udr", "uxg"]:
-        category = "gateway"
-    else:
-        category = device_type
+    get = device.get
+    device_type = get("type", "unknown")
+
+    # Determine device category (unknown types keep their raw type)
+    category = _DEVICE_CATEGORIES.get(device_type, device_type)
 
-    # Build port summary for switches
-    port_table = device.get("port_table", [])
-    ports_used = sum(1 for p in port_table if p.get("up", False))
+    # Build port summary; switches and gateways (Dream Machines have ports)
+    # also get the formatted port table, counted in the same pass
+    port_table = get("port_table", [])
     ports_total = len(port_table)
+    ports = []
+    if category in _PORTED_CATEGORIES:
+        ports_used = 0
+        for p in port_table:
+            port = format_port(p)
+            ports.append(port)
+            if port["up"]:
+                ports_used += 1
+    else:
+        ports_used = sum(1 for p in port_table if p.get("up", False))
 
     # Get the IP address - for gateways, prefer the LAN IP over WAN IP
-    ip_address = device.get("ip", "")
+    original_ip = get("ip", "")
+    ip_address = original_ip
     if category == "gateway":
         # For UDM Pro/SE/etc, the 'ip' field might be the WAN IP
         # Check for LAN IP in various possible locations
         # 1. Check network_table for LAN network
-        network_table = device.get("network_table", [])
+        network_table = get("network_table", [])
         for net in network_table:
             # Look for the LAN network (usually named "LAN" or is the default network)
             net_name = net.get("name", "").lower()
@@ -168,39 +583,42 @@ def format_device(device):
                     ip_address = lan_ip
                     break
 
+        # Candidates below only ever replace ip_address with a non-empty
+        # value, so "still unresolved" is simply "still the original ip"
+
         # 2. Check config_network for LAN IP
-        if not ip_address or ip_address == device.get("ip", ""):
-            config_network = device.get("config_network", {})
-            if config_network.get("ip"):
-                ip_address = config_network.get("ip")
+        if ip_address == original_ip:
+            config_ip = get("config_network", {}).get("ip")
+            if config_ip:
+                ip_address = config_ip
 
         # 3. Check connect_request_ip (often the internal management IP)
-        if not ip_address or ip_address == device.get("ip", ""):
-            connect_ip = device.get("connect_request_ip", "")
-            # Only use if it looks like a private IP (192.168.x.x, 10.x.x.x, 172.16-31.x.x)
-            if connect_ip and (
-                connect_ip.startswith("192.168.") or
-                connect_ip.startswith("10.") or
-                connect_ip.startswith("172.")
-            ):
+        if ip_address == original_ip:
+            connect_ip = get("connect_request_ip", "")
+            # Only use if it is a private IP (192.168.x.x, 10.x.x.x, 172.16-31.x.x)
+            if connect_ip and is_lan_ip(connect_ip):
                 ip_address = connect_ip
 
     # Extract uplink info for topology building
-    uplink = device.get("uplink", {})
+    uplink = get("uplink", {})
     uplink_mac = uplink.get("uplink_mac", "") or uplink.get("mac", "")
     uplink_remote_port = uplink.get("uplink_remote_port")
 
+    system_stats = get("system-stats", {})
+    loadavg_1 = get("sys_stats", {}).get("loadavg_1", "")
+    name = get("name", get("model", "Unknown"))
+
     return {
         # Identity
-        "mac": device.get("mac", ""),
-        "name": device.get("name", device.get("model", "Unknown")),
-        "model": device.get("model", ""),
+        "mac": get("mac", ""),
+        "name": name,
+        "model": get("model", ""),
         "type": device_type,
         "category": category,
 
         # Network - use computed ip_address which prefers LAN IP for gateways
         "ip": ip_address,
-        "gateway_mac": device.get("gateway_mac", ""),
+        "gateway_mac": get("gateway_mac", ""),
 
         # Uplink/topology info - critical for automatic port connections!
         "uplink_mac": uplink_mac,  # MAC of the upstream device this device is connected to
@@ -209,122 +627,149 @@ def format_device(device):
         "uplink_type": uplink.get("type", ""),  # Connection type (wire, etc.)
 
         # Status
-        "state": device.get("state", 0),  # 1 = connected
-        "adopted": device.get("adopted", False),
-        "uptime": device.get("uptime", 0),
-        "last_seen": device.get("last_seen", 0),
+        "state": get("state", 0),  # 1 = connected
+        "adopted": get("adopted", False),
+        "uptime": get("uptime", 0),
+        "last_seen": get("last_seen", 0),
 
         # Version info
-        "version": device.get("version", ""),
-        "upgradable": device.get("upgradable", False),
+        "version": get("version", ""),
+        "upgradable": get("upgradable", False),
 
         # Switch/Gateway port info (Dream Machine gateways also have ports)
         "ports_total": ports_total,
         "ports_used": ports_used,
-        "port_table": [format_port(p) for p in port_table] if category in ["switch", "gateway"] else [],
+        "port_table": ports,
 
         # AP-specific
-        "num_sta": device.get("num_sta", 0),  # Number of connected stations
-        "channel": device.get("channel", ""),
-        "radio_table": device.get("radio_table", []),
+        "num_sta": get("num_sta", 0),  # Number of connected stations
+        "channel": get("channel", ""),
+        "radio_table": get("radio_table", []),
 
         # System stats
-        "cpu": device.get("system-stats", {}).get("cpu", ""),
-        "mem": device.get("system-stats", {}).get("mem", ""),
-        "loadavg_1": device.get("sys_stats", {}).get("loadavg_1", ""),
+        "cpu": system_stats.get("cpu", ""),
+        "mem": system_stats.get("mem", ""),
+        "loadavg_1": loadavg_1,
 
         # LLDP/Topology data - critical for port-to-device mapping!
-        "lldp_table": device.get("lldp_table", []),  # LLDP neighbor discovery table
-        "uplink": device.get("uplink", {}),  # Uplink connection info
-        "uplink_table": device.get("uplink_table", []),  # All uplink connections
-        "downlink_table": device.get("downlink_table", []),  # Downstream devices
-        "ethernet_table": device.get("ethernet_table", []),  # Ethernet interfaces
+        "lldp_table": get("lldp_table", []),  # LLDP neighbor discovery table
+        "uplink": uplink,  # Uplink connection info
+        "uplink_table": get("uplink_table", []),  # All uplink connections
+        "downlink_table": get("downlink_table", []),  # Downstream devices
+        "ethernet_table": get("ethernet_table", []),  # Ethernet interfaces
     }
 
 
 def format_port(port):
     """Format a switch port entry with MAC address fields for device identification."""
+    get = port.get
     return {
-        "port_idx": port.get("port_idx"),
-        "name": port.get("name", f"Port {port.get('port_idx', '?')}"),
-        "up": port.get("up", False),
-        "speed": port.get("speed", 0),
-        "full_duplex": port.get("full_duplex", False),
-        "poe_enable": port.get("poe_enable", False),
-        "poe_mode": port.get("poe_mode", ""),
-        "poe_power": port.get("poe_power", ""),
-        "is_uplink": port.get("is_uplink", False),
+        "port_idx": get("port_idx"),
+        "name": get("name", f"Port {get('port_idx', '?')}"),
+        "up": get("up", False),
+        "speed": get("speed", 0),
+        "full_duplex": get("full_duplex", False),
+        "poe_enable": get("poe_enable", False),
+        "poe_mode": get("poe_mode", ""),
+        "poe_power": get("poe_power", ""),
+        "is_uplink": get("is_uplink", False),
         # MAC address fields for identifying connected devices
-        "mac": port.get("mac", ""),
-        "lldp_remote_mac": port.get("lldp_remote_mac", ""),  # LLDP discovered MAC
-        "port_mac": port.get("port_mac", ""),  # Alternative MAC field
+        "mac": get("mac", ""),
+        "lldp_remote_mac": get("lldp_remote_mac", ""),  # LLDP discovered MAC
+        "port_mac": get("port_mac", ""),  # Alternative MAC field
         # Additional MAC/topology fields
-        "mac_table": port.get("mac_table", []),  # All learned MACs on this port
-        "lldp_info": port.get("lldp_info", {}),  # Full LLDP neighbor info
-        "media": port.get("media", ""),  # Media type (e.g., GE, SFP+)
-        "stp_state": port.get("stp_state", ""),  # Spanning tree state
-        "tx_bytes": port.get("tx_bytes", 0),
-        "rx_bytes": port.get("rx_bytes", 0),
+        "mac_table": get("mac_table", []),  # All learned MACs on this port
+        "lldp_info": get("lldp_info", {}),  # Full LLDP neighbor info
+        "media": get("media", ""),  # Media type (e.g., GE, SFP+)
+        "stp_state": get("stp_state", ""),  # Spanning tree state
+        "tx_bytes": get("tx_bytes", 0),
+        "rx_bytes": get("rx_bytes", 0),
     }
 
 
-def format_client(client, device_names):
+def format_client(client, device_name):
     """
     Format a client record with the fields we care about.
     Includes switch port info, network details, and connection state.
+    device_name is the bound .get of the {mac: name} device map, looked up
+    once by the caller rather than on every client.
     """
-    sw_mac = client.get("sw_mac", "")
+    get = client.get
+
+    # Derived fields are computed up front so the record below is a single
+    # constant-key literal, which CPython allocates at its final size
+    hostname = get("hostname", get("name", "Unknown"))
+    name = get("name", get("hostname", ""))
+    sw_mac = get("sw_mac", "")
+    sw_port = get("sw_port")
+    # Wireless clients have no sw_mac, so skip the device lookup for them
+    sw_name = device_name(sw_mac, "Unknown Switch") if sw_mac else "Unknown Switch"
 
     return {
         # Identity
-        "mac": client.get("mac", ""),
-        "hostname": client.get("hostname", client.get("name", "Unknown")),
-        "name": client.get("name", client.get("hostname", "")),
-        "oui": client.get("oui", ""),  # Manufacturer
+        "mac": get("mac", ""),
+        "hostname": hostname,
+        "name": name,
+        "oui": get("oui", ""),  # Manufacturer
 
         # Network details
-        "ip": client.get("ip", ""),
-        "network": client.get("network", ""),
-        "vlan": client.get("vlan", 1),
+        "ip": get("ip", ""),
+        "network": get("network", ""),
+        "vlan": get("vlan", 1),
 
         # Switch port info (the key data you need!)
-        "sw_port": client.get("sw_port"),
+        "sw_port": sw_port,
         "sw_mac": sw_mac,
-        "sw_name": device_names.get(sw_mac, "Unknown Switch"),
-        "sw_depth": client.get("sw_depth"),
+        "sw_name": sw_name,
+        "sw_depth": get("sw_depth"),
 
         # Connection state
-        "is_wired": client.get("is_wired", False),
-        "is_guest": client.get("is_guest", False),
-        "uptime": client.get("uptime", 0),
-        "last_seen": client.get("last_seen", 0),
-        "first_seen": client.get("first_seen", 0),
+        "is_wired": get("is_wired", False),
+        "is_guest": get("is_guest", False),
+        "uptime": get("uptime", 0),
+        "last_seen": get("last_seen", 0),
+        "first_seen": get("first_seen", 0),
 
         # Wireless info (if applicable)
-        "essid": client.get("essid", ""),
-        "radio": client.get("radio", ""),
-        "signal": client.get("signal", 0),
-        "channel": client.get("channel"),
-        "ap_mac": client.get("ap_mac", ""),
+        "essid": get("essid", ""),
+        "radio": get("radio", ""),
+        "signal": get("signal", 0),
+        "channel": get("channel"),
+        "ap_mac": get("ap_mac", ""),
 
         # Traffic stats
-        "tx_bytes": client.get("tx_bytes", 0),
-        "rx_bytes": client.get("rx_bytes", 0),
-        "tx_packets": client.get("tx_packets", 0),
-        "rx_packets": client.get("rx_packets", 0),
+        "tx_bytes": get("tx_bytes", 0),
+        "rx_bytes": get("rx_bytes", 0),
+        "tx_packets": get("tx_packets", 0),
+        "rx_packets": get("rx_packets", 0),
 
         # Additional useful fields
-        "satisfaction": client.get("satisfaction", 100),
-        "noted": client.get("noted", False),
-        "usergroup_id": client.get("usergroup_id", ""),
+        "satisfaction": get("satisfaction", 100),
+        "noted": get("noted", False),
+        "usergroup_id": get("usergroup_id", ""),
 
         # Additional switch/topology fields for port mapping
         "switch_mac": sw_mac,  # Alias for sw_mac (for clarity)
-        "switch_port": client.get("sw_port"),  # Alias for sw_port
-        "switch_name": device_names.get(sw_mac, "Unknown Switch"),  # Alias for sw_name
+        "switch_port": sw_port,  # Alias for sw_port
+        "switch_name": sw_name,  # Alias for sw_name
     }
 
 
+def fetch_all(session, config):
+    """
+    Fetch devices and clients concurrently - they are independent HTTPS
+    round-trips, so wall time becomes the slower of the two, not the sum.
+    Returns (device_names, devices, raw_clients); raises SessionExpired if
+    the controller rejects the session cookie.
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        devices_future = executor.submit(get_devices, session, config)
+        clients_future = executor.submit(get_clients, session, config)
+        device_names, devices = devices_future.result()
+        raw_clients = clients_future.result()
+    return device_names, devices, raw_clients
+
+
 def main():
     """Main entry point - fetch and output client and device data as JSON."""
     config = get_config()
@@ -338,50 +783,69 @@ def main():
         }))
         sys.exit(1)
 
-    # Create session with cookie persistence
-    session = requests.Session()
-
-    # Authenticate
-    if not authenticate(session, config):
-        sys.exit(1)
-
-    # Get devices (returns name_map for client lookups AND full device list)
-    device_names, devices = get_devices(session, config)
+    # Shared session with cookie persistence and pooled connections
+    session = _SESSION
 
-    # Get all clients
-    raw_clients = get_clients(session, config)
+    # Authenticate, unless a login cookie from a previous run can be reused
+    if not load_cookies(session, config["cookie_file"]):
+        if not authenticate(session, config):
+            sys.exit(1)
 
-    # Format clients with relevant fields
-    clients = [format_client(c, device_names) for c in raw_clients]
-
-    # Sort clients by hostname for consistent ordering
-    clients.sort(key=lambda x: x.get("hostname", "").lower())
-
-    # Sort devices by name
-    devices.sort(key=lambda x: x.get("name", "").lower())
-
-    # Count device types
-    switches = [d for d in devices if d.get("category") == "switch"]
-    access_points = [d for d in devices if d.get("category") == "access_point"]
-    gateways = [d for d in devices if d.get("category") == "gateway"]
+    try:
+        device_names, devices, raw_clients = fetch_all(session, config)
+    except SessionExpired:
+        # Saved cookie has expired - log in again and retry once
+        discard_cookies(session)
+        if not authenticate(session, config):
+            sys.exit(1)
+        try:
+            device_names, devices, raw_clients = fetch_all(session, config)
+        except SessionExpired:
+            # Rejected even with a fresh login - report it like a failed login
+            print(json.dumps({"error": "Authentication failed: session rejected after login", "clients": []}))
+            sys.exit(1)
+
+    save_cookies(session)
+
+    # Format clients with relevant fields, counting wired clients and
+    # building their sort keys in the same pass
+    keyed_clients = []
+    wired_count = 0
+    device_name = device_names.get
+    for i, raw_client in enumerate(raw_clients):
+        client = format_client(raw_client, device_name)
+        keyed_clients.append((client["hostname"].lower(), i, client))
+        if client["is_wired"]:
+            wired_count += 1
+
+    # Sort clients by hostname for consistent ordering (the index keeps the
+    # sort stable and means client dicts are never compared)
+    keyed_clients.sort()
+    clients = [client for _, _, client in keyed_clients]
+
+    # Count device types in a single pass
+    category_counts = Counter(d["category"] for d in devices)
 
     # Output JSON for Home Assistant command_line sensor
     output = {
         # Client data
         "clients": clients,
         "total_count": len(clients),
-        "wired_count": sum(1 for c in clients if c.get("is_wired")),
-        "wireless_count": sum(1 for c in clients if not c.get("is_wired")),
+        "wired_count": wired_count,
+        "wireless_count": len(clients) - wired_count,
 
         # Device data (NEW!)
         "devices": devices,
         "device_count": len(devices),
-        "switch_count": len(switches),
-        "ap_count": len(access_points),
-        "gateway_count": len(gateways),
+        "switch_count": category_counts["switch"],
+        "ap_count": category_counts["access_point"],
+        "gateway_count": category_counts["gateway"],
     }
 
-    print(json.dumps(output))
+    write_json(output)
+
+    # Close pooled connections cleanly rather than leaving it to interpreter exit
+    session.close()
 
 
 if __name__ == "__main__":